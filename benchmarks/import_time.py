@@ -0,0 +1,48 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = [
+    ('import elefix', 'import elefix'),
+    ('import elefix + raw lookup names', 'import elefix; elefix.set_altitudes; elefix.module.srtm_load'),
+    ('import elefix + smoothing/parsing (eager)', 'import elefix; elefix.non_uniform_savgol'),
+]
+
+
+def time_statement(statement, repeat):
+
+    # time spent in the statement alone, timed inside a fresh interpreter
+    code = 'import time; t = time.perf_counter(); {}; print(time.perf_counter() - t)'
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code.format(statement)],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        times.append(float(out))
+    return statistics.median(times)
+
+
+def loaded_modules(statement):
+
+    code = '{}; import sys; print(len(sys.modules)); print(int("numpy" in sys.modules))'.format(statement)
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+    return int(out[0]), bool(int(out[1]))
+
+
+def main(repeat):
+
+    print('Statement\tMedian (ms)\tModules\tNumPy loaded')
+    for label, statement in STATEMENTS:
+        t = time_statement(statement, repeat)
+        n_modules, numpy_loaded = loaded_modules(statement)
+        print('{}\t{:.1f}\t{}\t{}'.format(label, t * 1000, n_modules, numpy_loaded))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Measures the cold import time of elefix")
+    parser.add_argument("-r", "--repeat", default=15, type=int, help='Number of fresh interpreters per statement')
+    args = parser.parse_args()
+
+    main(args.repeat)
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+
+import elefix.module
+
+
+def write_synthetic_tile(srtm_dir, tile, ncols=600):
+
+    # smooth hills covering the whole 5x5 degrees tile
+    cellsize = 5.0 / ncols
+    xllcenter = (tile.col - 1) * 5 - 180 + cellsize / 2
+    yllcenter = 60 - tile.row * 5 + cellsize / 2
+    fpath = os.path.join(srtm_dir, elefix.module.srtm_tile_build_fname(tile))
+    with open(fpath, 'wb') as f:
+        array('d', [ncols, ncols, xllcenter, yllcenter, cellsize, -9999]).tofile(f)
+        for r in range(ncols):
+            array('h', [ (r * 7 + c * 3) % 2000 for c in range(ncols) ]).tofile(f)
+
+
+def random_track(n_points):
+
+    lat = random.uniform(42.5, 42.9)
+    lon = random.uniform(-2.5, -2.1)
+    lats, lons = [], []
+    for _ in range(n_points):
+        lat += random.uniform(-0.0002, 0.0002)
+        lon += random.uniform(-0.0002, 0.0002)
+        lats.append(lat)
+        lons.append(lon)
+    return lats, lons
+
+
+async def request(reader, writer, method, path, payload=None):
+
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'.format(
+        method, path, len(body)).encode() + body)
+    await writer.drain()
+    await reader.readline()
+    headers = {}
+    while True:
+        ln = await reader.readline()
+        if ln == b'\r\n':
+            break
+        key, value = ln.decode().split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    return json.loads(await reader.readexactly(int(headers['content-length'])))
+
+
+async def client(host, port, n_requests, n_points, smooth, latencies):
+
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(n_requests):
+        lats, lons = random_track(n_points)
+        start = time.perf_counter()
+        response = await request(reader, writer, 'POST', '/altitudes',
+                                 {'lats': lats, 'lons': lons, 'smooth': smooth})
+        latencies.append(time.perf_counter() - start)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+    writer.close()
+
+
+async def run_load(host, port, clients, n_requests, n_points, smooth):
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[ client(host, port, n_requests, n_points, smooth, latencies) for _ in range(clients) ])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    metrics = await request(reader, writer, 'GET', '/metrics')
+    writer.close()
+
+    latencies.sort()
+    print('Requests: {} in {:.2f}s ({:.1f} req/s)'.format(len(latencies), elapsed, len(latencies) / elapsed))
+    print('Latency p50: {:.1f}ms  p95: {:.1f}ms  max: {:.1f}ms'.format(
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, latencies[-1] * 1000))
+    print('Server metrics: {}'.format(json.dumps(metrics)))
+
+
+def wait_for_port(host, port, timeout=30.0):
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('The server did not start listening on {}:{}'.format(host, port))
+
+
+def main(clients, n_requests, n_points, smooth, port):
+
+    # the server runs as `elefix serve` on a synthetic tile
+    with tempfile.TemporaryDirectory() as srtm_dir:
+        write_synthetic_tile(srtm_dir, elefix.module.TileSRTM(4, 36))
+        server = subprocess.Popen([sys.executable, '-m', 'elefix', 'serve', '--srtm-path', srtm_dir,
+                                   '--port', str(port), '--workers', '2'])
+        try:
+            wait_for_port('127.0.0.1', port)
+            asyncio.run(run_load('127.0.0.1', port, clients, n_requests, n_points, smooth))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Load tests the elefix HTTP service on localhost")
+    parser.add_argument("-c", "--clients", default=16, type=int, help='Concurrent clients')
+    parser.add_argument("-r", "--requests", default=20, type=int, help='Requests per client')
+    parser.add_argument("-n", "--points", default=500, type=int, help='Waypoints per request')
+    parser.add_argument("--no-smooth", action='store_true', help='Disable smoothing')
+    parser.add_argument("-p", "--port", default=8765, type=int, help='Local port')
+    args = parser.parse_args()
+
+    main(args.clients, args.requests, args.points, not args.no_smooth, args.port)
@@ -1,8 +1,11 @@
 import argparse
+import os
 from array import array
 
+DEFAULT_OVERVIEWS = [2, 4, 16]
 
-def main(asc_fpath, bin_fpath):
+
+def main(asc_fpath, bin_fpath, overviews=DEFAULT_OVERVIEWS):
 
     def parse_asc_header_line(ln, expected_key):
         key, value = ln.strip().split()
@@ -32,6 +35,20 @@ def main(asc_fpath, bin_fpath):
         if len(rows) != nrows:
             raise Exception("ASC file is not well formed, number of rows and nrows don't match")
 
+    write_bin(bin_fpath, ncols, nrows, xllcenter, yllcenter, cellsize, nodataval, rows)
+
+    # write the downsampled overview levels next to the tile
+    for factor in overviews:
+        ov_rows = downsample(rows, factor, nodataval)
+        ov_cellsize = cellsize * factor
+        ov_xllcenter = xllcorner + (ov_cellsize / 2.0)
+        ov_yllcenter = yllcorner + (cellsize * nrows) - (ov_cellsize * len(ov_rows)) + (ov_cellsize / 2.0)
+        write_bin(overview_fpath(bin_fpath, factor), len(ov_rows[0]), len(ov_rows),
+                  ov_xllcenter, ov_yllcenter, ov_cellsize, nodataval, ov_rows)
+
+
+def write_bin(bin_fpath, ncols, nrows, xllcenter, yllcenter, cellsize, nodataval, rows):
+
     with open(bin_fpath, 'wb') as f:
 
         # write header values
@@ -42,6 +59,32 @@ def main(asc_fpath, bin_fpath):
         for row in rows:
             row_array = array('h', row)
             row_array.tofile(f)
+
+
+def downsample(rows, factor, nodataval):
+
+    # average of each factor x factor block, ignoring NODATA cells
+    ncols = len(rows[0])
+    n_blocks = (ncols + factor - 1) // factor
+    ov_rows = []
+    for r in range(0, len(rows), factor):
+        sums = [0] * n_blocks
+        counts = [0] * n_blocks
+        for row in rows[r:r + factor]:
+            for c, value in enumerate(row):
+                if value != nodataval:
+                    sums[c // factor] += value
+                    counts[c // factor] += 1
+        ov_rows.append([ round(s / n) if n > 0 else nodataval for s, n in zip(sums, counts) ])
+
+    return ov_rows
+
+
+def overview_fpath(bin_fpath, factor):
+
+    # srtm_36_04.bin -> srtm_36_04_x4.bin, as expected by elefix
+    root, ext = os.path.splitext(bin_fpath)
+    return '{}_x{}{}'.format(root, factor, ext)
         
 
 if __name__ == '__main__':
@@ -49,6 +92,9 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Converts SRTM ASCII files to binary format")
     parser.add_argument("srtm_asc", help='[INPUT] SRTM ASCII file. i.e. srtm_36_04.asc')
     parser.add_argument("srtm_bin", help='[OUTPUT] SRTM binary file')
+    parser.add_argument("-o", "--overviews", nargs='*', type=int, default=DEFAULT_OVERVIEWS,
+                        help='Downsampling factors of the overview levels written next to the binary file '
+                        '(default: 2 4 16, none if the option is given without values)')
     args = parser.parse_args()
 
-    main(args.srtm_asc, args.srtm_bin)
+    main(args.srtm_asc, args.srtm_bin, args.overviews)
@@ -1,2 +1,27 @@
 from elefix.module import set_altitudes
-from elefix.helper import *
+import importlib
+
+# elefix.helper and elefix.grid pull in NumPy and xml.etree, so their names
+# and the heavier submodules are only imported on first use
+_HELPER_NAMES = ['EARTH_RADIUS', 'MAX_SPEED', 'Waypoint', 'tcx_parse', 'wpt_distance',
+                 'track_distances', 'track_preprocess', 'non_uniform_savgol', 'non_uniform_savgol_sliding']
+_GRID_NAMES = ['altitudes_for_grid', 'grid_shape', 'grid_coordinates']
+_SUBMODULES = ['grid', 'helper', 'prefetch', 'server']
+
+__all__ = ['set_altitudes'] + _HELPER_NAMES + _GRID_NAMES
+
+
+def __getattr__(name):
+
+    if name in _HELPER_NAMES:
+        return getattr(importlib.import_module('elefix.helper'), name)
+    if name in _GRID_NAMES:
+        return getattr(importlib.import_module('elefix.grid'), name)
+    if name in _SUBMODULES:
+        return importlib.import_module('elefix.' + name)
+    raise AttributeError("module 'elefix' has no attribute '{}'".format(name))
+
+
+def __dir__():
+
+    return sorted(set(globals()) | set(__all__) | set(_SUBMODULES))
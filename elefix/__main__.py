@@ -0,0 +1,37 @@
+import argparse
+import os
+
+import elefix.module
+import elefix.server
+
+
+def main():
+
+    parser = argparse.ArgumentParser(prog='elefix', description="Elevation data for latitude-longitude pairs")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    serve_parser = subparsers.add_parser('serve', help='Runs the HTTP/JSON elevation service')
+    serve_parser.add_argument("--host", default='127.0.0.1', help='Address to listen on')
+    serve_parser.add_argument("--port", default=8080, type=int, help='Port to listen on')
+    serve_parser.add_argument("--srtm-path", default=None, help='SRTM binary tiles directory (default: $SRTMPATH)')
+    serve_parser.add_argument("--max-tiles", default=16, type=int, help='Number of tiles kept warm in memory')
+    serve_parser.add_argument("--workers", default=os.cpu_count() or 1, type=int, help='Smoothing processes')
+    serve_parser.add_argument("--coalesce-ms", default=5.0, type=float, help='Time window to coalesce lookups')
+
+    index_parser = subparsers.add_parser('index', help='Writes the tile index of an SRTM directory')
+    index_parser.add_argument("--srtm-path", default=None, help='SRTM binary tiles directory (default: $SRTMPATH)')
+    index_parser.add_argument("--nodata", nargs='*', default=[], help='Tile files known to have no SRTM data (i.e. sea)')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        elefix.server.serve(args.host, args.port, args.srtm_path, args.max_tiles,
+                            args.workers, args.coalesce_ms / 1000)
+    elif args.command == 'index':
+        srtm_path = args.srtm_path or elefix.module.srtm_path_from_env()
+        print(elefix.module.srtm_write_index(srtm_path, args.nodata))
+
+
+if __name__ == '__main__':
+
+    main()
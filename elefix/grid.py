@@ -0,0 +1,128 @@
+from typing import Tuple
+
+import numpy as np
+
+import elefix.module
+from elefix.module import BoundingBox, Dem
+
+
+def grid_shape(bbox: BoundingBox, step: float) -> Tuple[int, int]:
+
+    if step <= 0:
+        raise ValueError('"step" must be a positive number')
+
+    if bbox.xmin > bbox.xmax or bbox.ymin > bbox.ymax:
+        raise ValueError('"bbox" must have xmin <= xmax and ymin <= ymax')
+
+    nrows = int(np.floor((bbox.ymax - bbox.ymin) / step + 1e-9)) + 1
+    ncols = int(np.floor((bbox.xmax - bbox.xmin) / step + 1e-9)) + 1
+
+    return nrows, ncols
+
+
+def grid_coordinates(bbox: BoundingBox, step: float) -> Tuple[np.ndarray, np.ndarray]:
+
+    # rows go from north to south, like the SRTM rasters
+    nrows, ncols = grid_shape(bbox, step)
+    lats = bbox.ymax - np.arange(nrows) * step
+    lons = bbox.xmin + np.arange(ncols) * step
+
+    return lats, lons
+
+
+def altitudes_for_grid(bbox: BoundingBox, step: float, out: np.ndarray = None,
+                       resolution: float = None, cache: dict = None) -> np.ndarray:
+    """
+    Altitudes of a regular latitude-longitude grid
+
+    The grid covers `bbox` every `step` degrees, with the first row at
+    bbox.ymax and the first column at bbox.xmin (see grid_coordinates).
+    Each altitude is interpolated like srtm_find_altitude does, but the
+    cell indices and interpolation weights are computed once per row and
+    once per column, and each tile fills its part of the grid at once.
+
+    Parameters
+    ----------
+    bbox : BoundingBox
+        Area to sample, in degrees
+    step : float
+        Distance between grid points, in degrees
+    out : np.array of float, optional
+        Preallocated output of shape grid_shape(bbox, step)
+    resolution : float, optional
+        Use the coarsest overview level not larger than this (meters)
+    cache : dict, optional
+        Already loaded DEMs, filled on misses. Its keys are (tile path,
+        'array') so that they don't clash with the DEMs of set_altitudes
+
+    Returns
+    -------
+    np.array of float
+        The altitudes, NaN where there is no SRTM data or the interpolation
+        uses a NODATA cell
+    """
+    srtm_path = elefix.module.srtm_path_from_env()
+    shape = grid_shape(bbox, step)
+
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise ValueError('"out" must be of shape {}'.format(shape))
+    out.fill(np.nan)
+
+    lats, lons = grid_coordinates(bbox, step)
+    for fpath in elefix.module.srtm_tile_fpaths(bbox, srtm_path, resolution):
+        key = (fpath, 'array')
+        dem = None if cache is None else cache.get(key)
+        if dem is None:
+            dem = srtm_load_array(fpath)
+            if cache is not None:
+                cache[key] = dem
+        rows = dem.rows
+
+        # grid rows and columns inside the tile
+        half_cell = dem.cellsize / 2
+        row_ids = np.flatnonzero((lats >= dem.yllcenter - half_cell) &
+                                 (lats <= dem.yllcenter - half_cell + dem.nrows * dem.cellsize))
+        col_ids = np.flatnonzero((lons >= dem.xllcenter - half_cell) &
+                                 (lons <= dem.xllcenter - half_cell + dem.ncols * dem.cellsize))
+        if len(row_ids) == 0 or len(col_ids) == 0:
+            continue
+
+        # nearest cell, adjacent cell and weight, once per row and column
+        x_row_f = (lons[col_ids] - dem.xllcenter) / dem.cellsize
+        x_row, x_adj, x_weight = _axis_interpolation(x_row_f, dem.ncols)
+        y_row_f = dem.nrows - 1 - (lats[row_ids] - dem.yllcenter) / dem.cellsize
+        y_row, y_adj, y_weight = _axis_interpolation(y_row_f, dem.nrows)
+
+        # plane through the nearest cell and both adjacent ones
+        z1 = rows[np.ix_(y_row, x_row)].astype(float)
+        z2 = rows[np.ix_(y_row, x_adj)].astype(float)
+        z3 = rows[np.ix_(y_adj, x_row)].astype(float)
+        alts = z1 + x_weight * (z2 - z1) + y_weight[:, None] * (z3 - z1)
+        alts[(z1 == dem.nodataval) | (z2 == dem.nodataval) | (z3 == dem.nodataval)] = np.nan
+        out[np.ix_(row_ids, col_ids)] = alts
+
+    return out
+
+
+def _axis_interpolation(pos_f: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+    # same choice of the adjacent cell as srtm_find_altitude
+    pos = np.clip(np.round(pos_f), 0, size - 1).astype(int)
+    below = pos_f - pos < 0
+    adj = np.where(below, np.where(pos > 0, pos - 1, pos + 1),
+                   np.where(pos < size - 1, pos + 1, pos - 1))
+    weight = (pos_f - pos) / (adj - pos)
+
+    return pos, adj, weight
+
+
+def srtm_load_array(fpath: str) -> Dem:
+
+    # like srtm_load, with the altitudes as a 2D NumPy array
+    with open(fpath, 'rb') as f:
+        ncols, nrows, xllcenter, yllcenter, cellsize, nodataval = elefix.module._srtm_read_header(f)
+        rows = np.fromfile(f, dtype=np.int16, count=nrows * ncols).reshape(nrows, ncols)
+
+    return Dem(ncols, nrows, xllcenter, yllcenter, cellsize, nodataval, rows)
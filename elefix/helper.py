@@ -1,10 +1,12 @@
 from collections import namedtuple
 from typing import List
 import xml.etree.ElementTree as ET
-from math import radians, cos, sqrt
+from math import radians, cos, sqrt, factorial
 import numpy as np
 
 EARTH_RADIUS = 6371000
+MAX_SPEED = 50.0  # m/s
+SLIDING_TOL = 1e-10
     
 Waypoint = namedtuple('Waypoint', 'lat, lon, alt')
 
@@ -38,6 +40,80 @@ def wpt_distance(wpt1: Waypoint, wpt2: Waypoint) -> float:
     return dist_2d
 
 
+def track_distances(lats, lons) -> np.ndarray:
+    """Distances in 2D between consecutive points, same as wpt_distance"""
+
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    x = (lons[1:] - lons[:-1]) * np.cos((lats[:-1] + lats[1:]) / 2)
+    y = lats[1:] - lats[:-1]
+
+    return EARTH_RADIUS * np.sqrt(x**2 + y**2)
+
+
+def track_preprocess(lats, lons, times=None, max_speed=MAX_SPEED):
+    """
+    Removes consecutive duplicates and GPS spikes from a track
+
+    A point is a duplicate when the next one is at distance 0, so the
+    last point of each run is kept. If `times` (seconds) are given, a
+    point is a spike when both the speed from the previous point and the
+    speed to the next one exceed `max_speed` (m/s). This is done in a
+    single pass, so two or more spikes in a row are not detected: each of
+    them has a plausible speed to its neighbouring spike.
+
+    Parameters
+    ----------
+    lats, lons : array_like
+        Latitudes and longitudes of the track
+    times : array_like, optional
+        Timestamps in seconds of each point
+    max_speed : float
+        Maximum plausible speed in m/s
+
+    Returns
+    -------
+    (np.array of int, np.array of int)
+        The indices of the kept points, and for each original point the
+        position in the kept points whose result it should take: the
+        kept twin for duplicates and the previous kept point for spikes
+        (and for the duplicates of a spike)
+    """
+    if len(lats) != len(lons):
+        raise ValueError('"lats" and "lons" must be of the same size')
+
+    if times is not None and len(times) != len(lats):
+        raise ValueError('"times" and "lats" must be of the same size')
+
+    n = len(lats)
+    if n == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # consecutive duplicates
+    duplicate = np.zeros(n, dtype=bool)
+    duplicate[:-1] = track_distances(lats, lons) == 0.0
+    nondup = np.flatnonzero(~duplicate)
+    kept = nondup
+
+    # spikes, both speeds are computed between non duplicated points
+    spike = np.zeros(n, dtype=bool)
+    if times is not None and len(kept) > 2:
+        dists = track_distances(np.asarray(lats, dtype=float)[kept], np.asarray(lons, dtype=float)[kept])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speeds = dists / np.abs(np.diff(np.asarray(times, dtype=float)[kept]))
+        too_fast = ~(speeds <= max_speed)
+        spike[kept[1:-1]] = too_fast[:-1] & too_fast[1:]
+        kept = kept[~spike[kept]]
+
+    # every point maps like the last point of its duplicate run, which
+    # maps to itself if kept or to the previous kept point if a spike
+    run_last = nondup[np.searchsorted(nondup, np.arange(n))]
+    index_map = np.searchsorted(kept, run_last)
+    index_map[spike[run_last]] -= 1
+
+    return kept, index_map
+
+
 # The following function was taken from https://dsp.stackexchange.com/a/64313
 def non_uniform_savgol(x, y, window, polynom):
     """
@@ -64,23 +140,7 @@ def non_uniform_savgol(x, y, window, polynom):
     np.array of float
         The smoothed y values
     """
-    if len(x) != len(y):
-        raise ValueError('"x" and "y" must be of the same size')
-
-    if len(x) < window:
-        raise ValueError('The data size must be larger than the window size')
-
-    if type(window) is not int:
-        raise TypeError('"window" must be an integer')
-
-    if window % 2 == 0:
-        raise ValueError('The "window" must be an odd integer')
-
-    if type(polynom) is not int:
-        raise TypeError('"polynom" must be an integer')
-
-    if polynom >= window:
-        raise ValueError('"polynom" must be less than "window"')
+    _check_savgol_args(x, y, window, polynom)
 
     half_window = window // 2
     polynom += 1
@@ -148,3 +208,183 @@ def non_uniform_savgol(x, y, window, polynom):
             x_i *= x[i] - x[-half_window - 1]
 
     return y_smoothed
+
+
+def non_uniform_savgol_sliding(x, y, window, polynom):
+    """
+    Applies a Savitzky-Golay filter to y with non-uniform spacing
+    as defined in x, in O(n * polynom^2) regardless of the window size
+
+    Instead of building the design matrix of every window, the power sums
+    sum(t^k) and sum(t^k * y) are kept as running sums while the window
+    slides over the data, and each local fit is solved from them. The sums
+    are accumulated in blocks of window / 2 centers, each one relative to
+    its middle and scaled to [-1, 1], and recentred on x[i] through the
+    binomial expansion of (t - d)^k.
+
+    The recentring loses precision when a window is much narrower than its
+    block, e.g. when most of its points come from a stopped GPS. For each
+    window the error is estimated from that span ratio and the conditioning
+    of the fit, and the windows where it could exceed SLIDING_TOL (1e-10
+    relative) are fitted directly instead, in O(window * polynom^2) each.
+    The result is then as accurate as non_uniform_savgol, and more so when
+    its unscaled fits are badly conditioned. Borders are interpolated the
+    same way.
+
+    Parameters
+    ----------
+    x : array_like
+        List of floats representing the x values of the data
+    y : array_like
+        List of floats representing the y values. Must have same length
+        as x
+    window : int (odd)
+        Window length of datapoints. Must be odd and smaller than x
+    polynom : int
+        The order of polynom used. Must be smaller than the window size
+
+    Returns
+    -------
+    np.array of float
+        The smoothed y values
+    """
+    _check_savgol_args(x, y, window, polynom)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    half_window = window // 2
+    polynom += 1
+
+    centers = np.arange(half_window, n - half_window)
+    coeffs = np.empty((len(centers), polynom))
+    y_smoothed = np.full(n, np.nan)
+
+    # Blocks of centers are processed in chunks of bounded memory
+    block_size = max(half_window // 2, 1)
+    n_blocks = -(-len(centers) // block_size)
+    chunk = max(2 ** 20 // ((block_size + window) * (2 * polynom - 1)), 1)
+    for b in range(0, n_blocks, chunk):
+        first = b * block_size
+        last = min((b + chunk) * block_size, len(centers))
+        coeffs[first:last] = _sliding_fits(x, y, centers[first:last], half_window, polynom, block_size)
+
+    y_smoothed[centers] = coeffs[:, 0]
+
+    # Interpolate the result at the borders
+    t = x[:half_window] - x[half_window]
+    y_smoothed[:half_window] = np.polynomial.polynomial.polyval(t, coeffs[0])
+    t = x[n - half_window:] - x[-half_window - 1]
+    y_smoothed[n - half_window:] = np.polynomial.polynomial.polyval(t, coeffs[-1])
+
+    return y_smoothed
+
+
+def _check_savgol_args(x, y, window, polynom):
+
+    if len(x) != len(y):
+        raise ValueError('"x" and "y" must be of the same size')
+
+    if len(x) < window:
+        raise ValueError('The data size must be larger than the window size')
+
+    if type(window) is not int:
+        raise TypeError('"window" must be an integer')
+
+    if window % 2 == 0:
+        raise ValueError('The "window" must be an odd integer')
+
+    if type(polynom) is not int:
+        raise TypeError('"polynom" must be an integer')
+
+    if polynom >= window:
+        raise ValueError('"polynom" must be less than "window"')
+
+
+def _sliding_fits(x, y, centers, half_window, polynom, block_size):
+
+    # local fit coefficients of consecutive centers, block_size at a time
+    window = 2 * half_window + 1
+    n_powers = 2 * polynom - 1
+    n_blocks = -(-len(centers) // block_size)
+    block = centers[0] + np.arange(n_blocks * block_size).reshape(n_blocks, block_size)
+    block = np.minimum(block, centers[-1])
+    ids = np.minimum(block[:, :1] - half_window + np.arange(block_size + window - 1), len(x) - 1)
+
+    # Anchor every block on its middle and scale it to [-1, 1]
+    anchor = x[block[:, block_size // 2]][:, None]
+    scale = np.maximum(np.abs(x[ids] - anchor).max(axis=1, keepdims=True), np.finfo(float).tiny)
+    u = (x[ids] - anchor) / scale
+
+    # Running power sums over each window of the blocks
+    u_pow = np.ones((n_powers,) + u.shape)
+    for k in range(1, n_powers):
+        u_pow[k] = u_pow[k - 1] * u
+    first = np.arange(block_size)
+    sum_u = _window_sums(u_pow, first, first + window)
+    sum_uy = _window_sums(u_pow[:polynom] * y[ids], first, first + window)
+
+    # Recentre the sums on x[i], and rescale them to the half span r of
+    # each window so that the local fits are well balanced
+    d = (x[block] - anchor) / scale
+    r = np.maximum(x[block + half_window] - x[block], x[block] - x[block - half_window]) / scale
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        r_pow = r ** np.arange(n_powers)[:, None, None]
+        sum_t = (_recentre(sum_u, d) / r_pow).reshape(n_powers, -1)
+        sum_ty = (_recentre(sum_uy, d) / r_pow[:polynom]).reshape(polynom, -1)
+
+        # Solve (tA A) c = tA y, where tA A is the Hankel matrix of sum(t^k)
+        tAA = np.moveaxis(sum_t[np.add.outer(np.arange(polynom), np.arange(polynom))], -1, 0)
+        valid = np.all(np.isfinite(tAA), axis=(1, 2))
+        tAA[~valid] = np.eye(polynom)
+        c = np.linalg.solve(tAA, sum_ty.T[:, :, None])[:, :, 0]
+        c /= (r.reshape(-1, 1) * np.repeat(scale, block_size, axis=0)) ** np.arange(polynom)
+
+        # The recentring loses about ((1 + |d|) / r)^k digits, which the
+        # conditioning of the fit amplifies. Windows whose error could
+        # exceed SLIDING_TOL are fitted directly
+        eigvals = np.linalg.eigvalsh(tAA)
+        cond = eigvals[:, -1] / np.maximum(eigvals[:, 0], 0)
+        error = np.finfo(float).eps * ((1 + np.abs(d.ravel())) / r.ravel()) ** (n_powers - 1) * cond
+    c = c[:len(centers)]
+    inexact = np.flatnonzero(~valid[:len(centers)] | ~(error[:len(centers)] <= SLIDING_TOL))
+    if len(inexact) > 0:
+        c[inexact] = _direct_fit(x, y, centers[inexact], half_window, polynom)
+
+    return c
+
+
+def _window_sums(values, first, last):
+
+    # differences of prefix sums along the last axis
+    acc = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    np.cumsum(values, axis=-1, out=acc[..., 1:])
+    return acc[..., last] - acc[..., first]
+
+
+def _direct_fit(x, y, centers, half_window, polynom):
+
+    # the local fits of non_uniform_savgol, each window scaled to [-1, 1]
+    coeffs = np.empty((len(centers), polynom))
+    chunk = max(2 ** 20 // ((2 * half_window + 1) * polynom), 1)
+    for b in range(0, len(centers), chunk):
+        ids = centers[b:b + chunk, None] + np.arange(-half_window, half_window + 1)
+        t = x[ids] - x[centers[b:b + chunk], None]
+        scale = np.maximum(np.abs(t).max(axis=1), np.finfo(float).tiny)
+        A = (t / scale[:, None])[:, :, None] ** np.arange(polynom)
+        tA = np.swapaxes(A, 1, 2)
+        c = np.linalg.solve(tA @ A, tA @ y[ids][:, :, None])[:, :, 0]
+        coeffs[b:b + chunk] = c / scale[:, None] ** np.arange(polynom)
+
+    return coeffs
+
+
+def _recentre(sums, d):
+
+    # sum((u - d)^k) = sum_m C(k, m) * (-d)^(k - m) * sum(u^m)
+    out = np.zeros_like(sums)
+    for k in range(sums.shape[0]):
+        for m in range(k + 1):
+            binom = factorial(k) // (factorial(m) * factorial(k - m))
+            out[k] += binom * (-d) ** (k - m) * sums[m]
+    return out
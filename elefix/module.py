@@ -1,29 +1,35 @@
 from collections import namedtuple
 from typing import List, Tuple
 from array import array
+from itertools import accumulate
+from math import pi
 import os
+import re
 
-import elefix.helper
+# elefix.helper (NumPy) and the process pool are imported where they are
+# used, so that raw lookups don't pay for them at import time
 
 Waypoint = namedtuple('Waypoint', 'lat, lon')
 Point = namedtuple('Point', 'x, y, z')
 BoundingBox = namedtuple('BoundingBox', 'xmin, xmax, ymin, ymax')
 TileSRTM = namedtuple('TileSRTM', 'row, col')
 Dem = namedtuple('DEM', 'ncols, nrows, xllcenter, yllcenter, cellsize, nodataval, rows')
+TileIndex = namedtuple('TileIndex', 'tiles, nodata')
 
+SRTM_INDEX_FNAME = 'srtm_index.txt'
+METERS_PER_DEGREE = 6371000 * pi / 180
+_tile_indexes = {}
+_tile_cellsizes = {}
+_tile_levels = {}
 
-def set_altitudes(latitudes: List[float], longitudes: List[float],
-                  smooth: bool = True, window: int = 151, polynom: int = 2) -> List[float]:
 
-    if 'SRTMPATH' not in os.environ:
-        raise ValueError('Environment variable SRTMPATH must be set')
-    
-    srtm_path = os.environ['SRTMPATH']
-    if srtm_path == "":
-        raise ValueError('Environment variable SRTMPATH is empty')
+def set_altitudes(latitudes: List[float], longitudes: List[float],
+                  smooth: bool = True, window: int = 151, polynom: int = 2,
+                  workers: int = 1, resolution: float = None,
+                  preprocess: bool = False, times: List[float] = None,
+                  cache: dict = None) -> List[float]:
 
-    if not os.path.isdir(srtm_path):
-        raise ValueError('The path defined in SRTMPATH is not a valid directory')
+    srtm_path = srtm_path_from_env()
     
     if len(latitudes) != len(longitudes):
         raise ValueError('"latitudes" and "longitudes" must be of the same size')
@@ -33,16 +39,121 @@ def set_altitudes(latitudes: List[float], longitudes: List[float],
 
     if window < 0 or window % 2 == 0:
         raise ValueError('"window" must be a positive odd number')
+
+    if type(workers) is not int or workers < 1:
+        raise ValueError('"workers" must be a positive integer')
+
+    if resolution is not None and resolution <= 0:
+        raise ValueError('"resolution" must be a positive number')
+
+    if preprocess:
+        # duplicates and spikes are dropped, and get the altitude of the
+        # kept point they map to
+        import elefix.helper
+        kept, index_map = elefix.helper.track_preprocess(latitudes, longitudes, times)
+        altitudes = set_altitudes([ latitudes[i] for i in kept ], [ longitudes[i] for i in kept ],
+                                  smooth, window, polynom, workers, resolution, cache=cache)
+        return [ altitudes[i] for i in index_map ]
     
     wpts = [ Waypoint(*wpt) for wpt in zip(latitudes, longitudes) ]
+    altitudes = srtm_lookup_altitudes(wpts, srtm_path, cache, resolution)
+
+    if smooth:
+        altitudes = smooth_altitudes(latitudes, longitudes, altitudes, window, polynom, workers)
+        
+    return altitudes
+
+
+def srtm_path_from_env() -> str:
+
+    if 'SRTMPATH' not in os.environ:
+        raise ValueError('Environment variable SRTMPATH must be set')
+    
+    srtm_path = os.environ['SRTMPATH']
+    if srtm_path == "":
+        raise ValueError('Environment variable SRTMPATH is empty')
+
+    if not os.path.isdir(srtm_path):
+        raise ValueError('The path defined in SRTMPATH is not a valid directory')
+
+    return srtm_path
+
+
+def srtm_tile_index(srtm_path: str, refresh: bool = False) -> TileIndex:
+
+    # tiles listed in the precomputed index of srtm_path, or None if there
+    # is no index. It is read again when the file changes or on refresh.
+    index_fpath = os.path.join(srtm_path, SRTM_INDEX_FNAME)
+    try:
+        mtime = os.stat(index_fpath).st_mtime_ns
+    except FileNotFoundError:
+        _tile_indexes.pop(srtm_path, None)
+        return None
+
+    cached = _tile_indexes.get(srtm_path)
+    if refresh or cached is None or cached[0] != mtime:
+        tiles = set()
+        nodata = set()
+        with open(index_fpath, 'r') as f:
+            for ln in f:
+                fname = ln.strip()
+                if fname.startswith('-'):
+                    nodata.add(fname[1:])
+                elif fname != '':
+                    tiles.add(fname)
+        cached = (mtime, TileIndex(frozenset(tiles), frozenset(nodata)))
+        _tile_indexes[srtm_path] = cached
+
+    return cached[1]
+
+
+def _srtm_index_add_tile(srtm_path: str, index: TileIndex, fname: str) -> TileIndex:
+
+    # the index is outdated. The cached one is replaced, not modified, as
+    # other threads may be reading it
+    updated = TileIndex(index.tiles | {fname}, index.nodata)
+    cached = _tile_indexes.get(srtm_path)
+    if cached is not None and cached[1] is index:
+        _tile_indexes[srtm_path] = (cached[0], updated)
+
+    return updated
+
+
+def srtm_write_index(srtm_path: str, nodata: List[str] = ()) -> str:
+
+    # tiles without SRTM data (i.e. sea) already in the index are kept
+    fnames = sorted( fname for fname in os.listdir(srtm_path) if fname.endswith('.bin') )
+    index = srtm_tile_index(srtm_path)
+    nodata = set(nodata) | (set() if index is None else index.nodata)
+    index_fpath = os.path.join(srtm_path, SRTM_INDEX_FNAME)
+    with open(index_fpath, 'w') as f:
+        for fname in fnames:
+            f.write(fname + '\n')
+        for fname in sorted(nodata - set(fnames)):
+            f.write('-' + fname + '\n')
+
+    return index_fpath
+
+
+def srtm_lookup_altitudes(wpts: List[Waypoint], srtm_path: str, cache: dict = None,
+                          resolution: float = None) -> List[float]:
+
     bbox = track_boundingbox(wpts)
-    tiles = srtm_find_tiles(bbox)
+    fpaths = srtm_tile_fpaths(bbox, srtm_path, resolution)
 
+    return srtm_lookup_in_tiles(wpts, fpaths, cache)
+
+
+def srtm_lookup_in_tiles(wpts: List[Waypoint], fpaths: List[str], cache: dict = None) -> List[float]:
+
+    # cache maps tile paths to already loaded DEMs, it is filled on misses
     altitudes = [None] * len(wpts)
-    for tile in tiles:
-        fname = srtm_tile_build_fname(tile)
-        fpath = os.path.join(srtm_path, fname)
-        dem = srtm_load(fpath)
+    for fpath in fpaths:
+        dem = None if cache is None else cache.get(fpath)
+        if dem is None:
+            dem = srtm_load(fpath)
+            if cache is not None:
+                cache[fpath] = dem
     
         for i in range(len(wpts)):
             wpt = wpts[i]
@@ -50,20 +161,100 @@ def set_altitudes(latitudes: List[float], longitudes: List[float],
             if alt is not None:
                 altitudes[i] = alt
 
-    if smooth:
-        altitudes = smooth_altitudes(latitudes, longitudes, altitudes, window, polynom)
-        
     return altitudes
 
 
-def smooth_altitudes(lats: List[float], lons: List[float], alts: List[float], win: int, polynom: int) -> List[float]:
+def srtm_tile_fpaths(bbox: BoundingBox, srtm_path: str, resolution: float = None) -> List[str]:
+
+    # resolution (meters) selects the coarsest adequate overview level
+    index = srtm_tile_index(srtm_path)
+
+    fpaths = []
+    for tile in srtm_find_tiles(bbox):
+        fname = srtm_tile_build_fname(tile)
+        fpath = os.path.join(srtm_path, fname)
+        if index is not None and fname not in index.tiles and fname not in index.nodata:
+            # the tile may have been added after the index was loaded, or
+            # the index removed (then the tile is loaded as without one)
+            index = srtm_tile_index(srtm_path, refresh=True)
+            if index is not None and fname not in index.tiles and fname not in index.nodata:
+                if not os.path.isfile(fpath):
+                    raise FileNotFoundError('SRTM tile {} is missing and not listed in {}'.format(
+                        fpath, os.path.join(srtm_path, SRTM_INDEX_FNAME)))
+                index = _srtm_index_add_tile(srtm_path, index, fname)
+        if index is not None and fname in index.nodata:
+            # known to have no SRTM data (i.e. sea)
+            continue
+        if resolution is not None:
+            level = srtm_tile_level(tile, srtm_path, resolution)
+            fpath = os.path.join(srtm_path, srtm_tile_build_fname(tile, level))
+        fpaths.append(fpath)
+
+    return fpaths
+
+
+def smooth_altitudes(lats: List[float], lons: List[float], alts: List[float], win: int, polynom: int,
+                     workers: int = 1) -> List[float]:
+
+    import elefix.helper
+
+    if any( alt is None for alt in alts ):
+        raise ValueError('Some waypoints have no SRTM data (i.e. sea), their altitudes can\'t be smoothed')
 
     wpts = [ elefix.helper.Waypoint(w[0], w[1], w[2]) for w in zip(lats, lons, alts) ] 
     dists = [ elefix.helper.wpt_distance(wpair[0], wpair[1]) for wpair in zip(wpts[:-1], wpts[1:]) ]
-    dists_acc = [ sum(dists[:i]) for i in range(len(wpts)) ]
+    dists_acc = [0.0] + list(accumulate(dists)) if wpts else []
+
+    if workers > 1:
+        return smooth_segments_parallel(dists_acc, alts, win, polynom, workers)
     
     return elefix.helper.non_uniform_savgol(dists_acc, alts, win, polynom)
-    
+
+
+def smooth_segments_parallel(dists_acc: List[float], alts: List[float], win: int, polynom: int,
+                             workers: int) -> List[float]:
+
+    from concurrent.futures import ProcessPoolExecutor
+    import numpy as np
+    import elefix.helper
+
+    # Each window center only depends on the half window at each side, so
+    # the centers are split in chunks and every segment carries the half
+    # window overlap it needs. The first and last segments also reproduce
+    # the border interpolation, so the stitched result is bit-identical to
+    # the serial one.
+    half_win = win // 2
+    n_centers = len(dists_acc) - 2 * half_win
+    n_segments = min(workers, n_centers // 2)
+    if n_segments < 2:
+        return elefix.helper.non_uniform_savgol(dists_acc, alts, win, polynom)
+
+    bounds = [ half_win + (n_centers * k) // n_segments for k in range(n_segments + 1) ]
+    bounds[0] = 0
+    bounds[-1] = len(dists_acc)
+    segments = [ (dists_acc[max(start - half_win, 0):min(end + half_win, len(dists_acc))],
+                  alts[max(start - half_win, 0):min(end + half_win, len(alts))],
+                  win, polynom)
+                 for start, end in zip(bounds[:-1], bounds[1:]) ]
+
+    with ProcessPoolExecutor(max_workers=n_segments) as executor:
+        results = list(executor.map(_smooth_segment, segments))
+
+    smoothed = []
+    for k, result in enumerate(results):
+        start = 0 if k == 0 else half_win
+        end = len(result) if k == n_segments - 1 else len(result) - half_win
+        smoothed.append(result[start:end])
+
+    return np.concatenate(smoothed)
+
+
+def _smooth_segment(args: Tuple[List[float], List[float], int, int]) -> List[float]:
+
+    import elefix.helper
+
+    return elefix.helper.non_uniform_savgol(*args)
+
 
 def track_boundingbox(wpts: List[Waypoint]) -> BoundingBox:
 
@@ -104,9 +295,74 @@ def srtm_find_tile(wpt: Waypoint) -> TileSRTM:
     return TileSRTM(row, col)
 
 
-def srtm_tile_build_fname(tile: TileSRTM) -> str:
+def srtm_tile_build_fname(tile: TileSRTM, level: int = 1) -> str:
+
+    if level == 1:
+        return 'srtm_{:02d}_{:02d}.bin'.format(tile.col, tile.row)
+
+    # overview level downsampled by a factor of `level`
+    return 'srtm_{:02d}_{:02d}_x{}.bin'.format(tile.col, tile.row, level)
+
+
+def srtm_tile_levels(tile: TileSRTM, srtm_path: str) -> List[int]:
+
+    # without an index the directory is scanned once per tile, only to
+    # find the levels, and they are kept like the cell sizes
+    index = srtm_tile_index(srtm_path)
+    if index is None and (srtm_path, tile) in _tile_levels:
+        return _tile_levels[srtm_path, tile]
+    fnames = os.listdir(srtm_path) if index is None else index.tiles
+
+    prefix = srtm_tile_build_fname(tile)[:-len('.bin')]
+    levels = [1]
+    for fname in fnames:
+        m = re.fullmatch(re.escape(prefix) + r'_x(\d+)\.bin', fname)
+        if m is not None:
+            levels.append(int(m.group(1)))
+    levels.sort()
+
+    if index is None:
+        _tile_levels[srtm_path, tile] = levels
+
+    return levels
+
+
+def srtm_tile_level(tile: TileSRTM, srtm_path: str, resolution: float) -> int:
+
+    # coarsest level whose cells are not larger than resolution (meters)
+    fpath = os.path.join(srtm_path, srtm_tile_build_fname(tile))
+    if fpath not in _tile_cellsizes:
+        _tile_cellsizes[fpath] = srtm_load_header(fpath).cellsize
+    cellsize_m = _tile_cellsizes[fpath] * METERS_PER_DEGREE
+
+    best = 1
+    for level in srtm_tile_levels(tile, srtm_path):
+        if cellsize_m * level <= resolution:
+            best = level
+
+    return best
+    
+
+def srtm_load_header(fpath: str) -> Dem:
+
+    with open(fpath, 'rb') as f:
+        header = _srtm_read_header(f)
+
+    return Dem(*header, None)
+
+
+def _srtm_read_header(f) -> Tuple[int, int, float, float, float, int]:
+
+    header_array = array('d')
+    header_array.fromfile(f, 6)
+    ncols = int(header_array[0])
+    nrows = int(header_array[1])
+    xllcenter = float(header_array[2])
+    yllcenter = float(header_array[3])
+    cellsize = float(header_array[4])
+    nodataval = int(header_array[5])
 
-    return 'srtm_{:02d}_{:02d}.bin'.format(tile.col, tile.row)
+    return ncols, nrows, xllcenter, yllcenter, cellsize, nodataval
     
 
 def srtm_load(fpath: str) -> Dem:
@@ -114,14 +370,7 @@ def srtm_load(fpath: str) -> Dem:
     with open(fpath, 'rb') as f:
 
         # load header values
-        header_array = array('d')
-        header_array.fromfile(f, 6)
-        ncols = int(header_array[0])
-        nrows = int(header_array[1])
-        xllcenter = float(header_array[2])
-        yllcenter = float(header_array[3])
-        cellsize = float(header_array[4])
-        nodataval = int(header_array[5])
+        ncols, nrows, xllcenter, yllcenter, cellsize, nodataval = _srtm_read_header(f)
 
         # load altitude values
         rows = []
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+import threading
+
+import elefix.module
+from elefix.module import BoundingBox, Waypoint
+
+
+class TilePrefetcher:
+    """
+    Loads the tiles of upcoming work on background threads
+
+    Give it the bounding boxes or tracks that will be processed next and
+    pass it as `cache` to set_altitudes, so that tile I/O overlaps with
+    the lookup and smoothing of the current track:
+
+        with TilePrefetcher() as prefetcher:
+            prefetcher.prefetch_track(lats[0], lons[0])
+            for i in range(len(lats)):
+                if i + 1 < len(lats):
+                    prefetcher.prefetch_track(lats[i + 1], lons[i + 1])
+                alts = set_altitudes(lats[i], lons[i], cache=prefetcher)
+
+    At most `max_workers` tiles are loaded at the same time and at most
+    `max_tiles` tiles, loaded or in flight, are kept in memory. The least
+    recently used loaded tiles are dropped to make room, and prefetches
+    that don't fit while every slot is still loading are skipped (the
+    tile is then loaded on demand).
+    """
+
+    def __init__(self, srtm_path: str = None, max_workers: int = 2, max_tiles: int = 8):
+
+        if max_workers < 1:
+            raise ValueError('"max_workers" must be a positive number')
+
+        if max_tiles < 1:
+            raise ValueError('"max_tiles" must be a positive number')
+
+        if srtm_path is None:
+            srtm_path = elefix.module.srtm_path_from_env()
+
+        self.srtm_path = srtm_path
+        self.max_tiles = max_tiles
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def prefetch_bbox(self, bbox: BoundingBox, resolution: float = None) -> int:
+
+        scheduled = 0
+        for fpath in elefix.module.srtm_tile_fpaths(bbox, self.srtm_path, resolution):
+            if self._schedule(fpath):
+                scheduled += 1
+
+        return scheduled
+
+    def prefetch_track(self, latitudes: List[float], longitudes: List[float], resolution: float = None) -> int:
+
+        if len(latitudes) == 0:
+            return 0
+
+        wpts = [ Waypoint(*wpt) for wpt in zip(latitudes, longitudes) ]
+        return self.prefetch_bbox(elefix.module.track_boundingbox(wpts), resolution)
+
+    def get(self, fpath: str) -> elefix.module.Dem:
+
+        with self.lock:
+            future = self.tiles.get(fpath)
+            if future is not None:
+                self.tiles.move_to_end(fpath)
+
+        if future is None:
+            return None
+
+        try:
+            return future.result()
+        except OSError:
+            # let the caller load it again and report the error
+            with self.lock:
+                if self.tiles.get(fpath) is future:
+                    del self.tiles[fpath]
+            return None
+
+    def __setitem__(self, fpath: str, dem: elefix.module.Dem):
+
+        future = Future()
+        future.set_result(dem)
+        with self.lock:
+            if fpath in self.tiles or self._make_room():
+                self.tiles[fpath] = future
+                self.tiles.move_to_end(fpath)
+
+    def __len__(self) -> int:
+
+        return len(self.tiles)
+
+    def _schedule(self, fpath: str) -> bool:
+
+        with self.lock:
+            if fpath in self.tiles:
+                self.tiles.move_to_end(fpath)
+                return False
+            if not self._make_room():
+                return False
+            self.tiles[fpath] = self.executor.submit(elefix.module.srtm_load, fpath)
+            return True
+
+    def _make_room(self) -> bool:
+
+        # drop the least recently used loaded tiles, loads in flight stay
+        while len(self.tiles) >= self.max_tiles:
+            for fpath, future in self.tiles.items():
+                if future.done():
+                    del self.tiles[fpath]
+                    break
+            else:
+                return False
+
+        return True
+
+    def close(self):
+
+        self.executor.shutdown()
+        with self.lock:
+            self.tiles.clear()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
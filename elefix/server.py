@@ -0,0 +1,340 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List
+import asyncio
+import json
+import os
+import signal
+import time
+
+import elefix.module
+from elefix.module import Waypoint
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class TileCache:
+    """
+    Keeps the most recently used DEM tiles in memory
+
+    Behaves like the dict expected by srtm_lookup_altitudes. When more
+    than `max_tiles` tiles are stored the least recently used is dropped.
+    """
+
+    def __init__(self, max_tiles: int):
+
+        if max_tiles < 1:
+            raise ValueError('"max_tiles" must be a positive number')
+
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fpath: str) -> elefix.module.Dem:
+
+        dem = self.tiles.get(fpath)
+        if dem is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.tiles.move_to_end(fpath)
+        return dem
+
+    def __setitem__(self, fpath: str, dem: elefix.module.Dem):
+
+        self.tiles[fpath] = dem
+        self.tiles.move_to_end(fpath)
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+
+    def __len__(self) -> int:
+
+        return len(self.tiles)
+
+
+class LookupBatcher:
+    """
+    Coalesces concurrent lookups into batched tile scans
+
+    Requests arriving within `delay` seconds of each other are collected
+    and grouped when they touch a common tile. Every tile of a group is
+    loaded once, and each request is only looked up in its own tiles.
+    Lookups run one at a time on a dedicated thread, so the tile cache
+    needs no locking.
+    """
+
+    def __init__(self, srtm_path: str, cache: TileCache, delay: float):
+
+        self.srtm_path = srtm_path
+        self.cache = cache
+        self.delay = delay
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+        self.batches = 0
+        self.coalesced = 0
+
+    async def lookup(self, wpts: List[Waypoint]) -> List[float]:
+
+        bbox = elefix.module.track_boundingbox(wpts)
+        fpaths = elefix.module.srtm_tile_fpaths(bbox, self.srtm_path)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.pending:
+            loop.call_later(self.delay, self._flush)
+        self.pending.append((wpts, fpaths, future))
+        return await future
+
+    def _flush(self):
+
+        batch = self.pending
+        self.pending = []
+        for group in group_by_tiles(batch):
+            self.batches += 1
+            self.coalesced += len(group) - 1
+            asyncio.ensure_future(self._lookup_group(group))
+
+    async def _lookup_group(self, group: list):
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, self._lookup_requests, group)
+
+        for (_, _, future), result in zip(group, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _lookup_requests(self, group: list) -> list:
+
+        # the altitudes of each request, or the exception it raised
+        dems = {}
+        results = []
+        for wpts, fpaths, _ in group:
+            try:
+                for fpath in fpaths:
+                    if fpath not in dems:
+                        dem = self.cache.get(fpath)
+                        if dem is None:
+                            dem = elefix.module.srtm_load(fpath)
+                            self.cache[fpath] = dem
+                        dems[fpath] = dem
+                results.append(elefix.module.srtm_lookup_in_tiles(wpts, fpaths, dems))
+            except Exception as e:
+                results.append(e)
+
+        return results
+
+    def close(self):
+
+        self.executor.shutdown()
+
+
+def group_by_tiles(batch: list) -> List[list]:
+
+    # union of the requests sharing at least one tile
+    groups = []
+    for wpts, fpaths, future in batch:
+        tiles = set(fpaths)
+        merged = [ (set(tiles), [(wpts, fpaths, future)]) ]
+        for group_tiles, group in groups:
+            if group_tiles & tiles:
+                merged[0][0].update(group_tiles)
+                merged[0][1].extend(group)
+            else:
+                merged.append((group_tiles, group))
+        groups = merged
+
+    return [ group for _, group in groups ]
+
+
+class ElevationServer:
+    """
+    HTTP/JSON elevation service with warm tiles
+
+    Endpoints:
+        POST /altitudes  {"lats": [...], "lons": [...], "smooth": true,
+                          "window": 151, "polynom": 2}
+        GET  /metrics
+    """
+
+    def __init__(self, srtm_path: str, max_tiles: int = 16, workers: int = 1, coalesce_delay: float = 0.005):
+
+        if not os.path.isdir(srtm_path):
+            raise ValueError('The SRTM path {} is not a valid directory'.format(srtm_path))
+
+        self.cache = TileCache(max_tiles)
+        self.batcher = LookupBatcher(srtm_path, self.cache, coalesce_delay)
+        self.smooth_executor = ProcessPoolExecutor(max_workers=workers)
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def altitudes(self, params: dict) -> dict:
+
+        lats = params.get('lats')
+        lons = params.get('lons')
+        smooth = params.get('smooth', True)
+        window = params.get('window', 151)
+        polynom = params.get('polynom', 2)
+
+        if not isinstance(lats, list) or not isinstance(lons, list):
+            raise ValueError('"lats" and "lons" must be lists')
+
+        if len(lats) != len(lons):
+            raise ValueError('"lats" and "lons" must be of the same size')
+
+        if type(window) is not int or window < 0 or window % 2 == 0:
+            raise ValueError('"window" must be a positive odd number')
+
+        if type(polynom) is not int or polynom < 0:
+            raise ValueError('"polynom" must be a non-negative integer')
+
+        if type(smooth) is not bool:
+            raise ValueError('"smooth" must be a boolean')
+
+        if len(lats) == 0:
+            return {'altitudes': []}
+
+        wpts = [ Waypoint(float(lat), float(lon)) for lat, lon in zip(lats, lons) ]
+        alts = await self.batcher.lookup(wpts)
+
+        if smooth:
+            loop = asyncio.get_running_loop()
+            alts = await loop.run_in_executor(
+                self.smooth_executor, elefix.module.smooth_altitudes, lats, lons, alts, window, polynom)
+            alts = alts.tolist()
+
+        return {'altitudes': alts}
+
+    def metrics(self) -> dict:
+
+        return {
+            'uptime': time.time() - self.started,
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_avg': self.latency_total / self.requests if self.requests else 0.0,
+            'latency_max': self.latency_max,
+            'lookup_batches': self.batcher.batches,
+            'coalesced_requests': self.batcher.coalesced,
+            'tiles_warm': len(self.cache),
+            'tile_hits': self.cache.hits,
+            'tile_misses': self.cache.misses,
+        }
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple:
+
+        if path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': 'Use GET'}
+            return 200, self.metrics()
+
+        if path == '/altitudes':
+            if method != 'POST':
+                return 405, {'error': 'Use POST'}
+            start = time.perf_counter()
+            self.requests += 1
+            try:
+                params = json.loads(body)
+                if not isinstance(params, dict):
+                    raise ValueError('The request body must be a JSON object')
+                response = await self.altitudes(params)
+            except (ValueError, TypeError) as e:
+                self.errors += 1
+                return 400, {'error': str(e)}
+            except Exception as e:
+                self.errors += 1
+                return 500, {'error': str(e)}
+            latency = time.perf_counter() - start
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            return 200, response
+
+        return 404, {'error': 'Unknown path {}'.format(path)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    ln = await reader.readline()
+                    if ln in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = ln.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    status, response = 413, {'error': 'Request body too large'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    status, response = await self.dispatch(method, path, body)
+                    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                payload = json.dumps(response).encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                    status, HTTP_REASONS[status], len(payload), 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+
+        # stop on SIGINT/SIGTERM so that the smoothing workers are shut down
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except NotImplementedError:
+                pass
+
+        async with server:
+            await stop.wait()
+
+    def close(self):
+
+        self.batcher.close()
+        self.smooth_executor.shutdown()
+
+
+def serve(host: str = '127.0.0.1', port: int = 8080, srtm_path: str = None,
+          max_tiles: int = 16, workers: int = 1, coalesce_delay: float = 0.005):
+
+    if srtm_path is None:
+        srtm_path = elefix.module.srtm_path_from_env()
+
+    server = ElevationServer(srtm_path, max_tiles, workers, coalesce_delay)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
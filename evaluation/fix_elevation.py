@@ -2,8 +2,10 @@ import elefix
 import math
 import argparse
 import os
+from itertools import accumulate
 
-import plotly.express as px
+import numpy as np
+import plotly.graph_objects as go
 
 from eval import elevation_gain, track_avg_elevation_diff, DEFAULT_VERT_THRESHOLD
 
@@ -11,8 +13,11 @@ from eval import elevation_gain, track_avg_elevation_diff, DEFAULT_VERT_THRESHOL
 DEF_SAVGOL_WINDOW = 151
 DEF_SAVGOL_GRADE = 2
 
+# points drawn per series
+DEF_PLOT_POINTS = 2000
 
-def main(track_fpath, window, grade):
+
+def main(track_fpath, window, grade, plot_points):
 
     # validate input
     fname, ext = os.path.splitext(track_fpath)
@@ -28,12 +33,8 @@ def main(track_fpath, window, grade):
             wpts = elefix.tcx_parse(track_content)
 
     # remove waypoints for which the distance to the next one is 0
-    i = 0
-    while i < len(wpts)-1:
-        if elefix.wpt_distance(wpts[i], wpts[i+1]) == 0.0:
-            del wpts[i]
-        else:
-            i += 1
+    kept, _ = elefix.track_preprocess([ wpt.lat for wpt in wpts ], [ wpt.lon for wpt in wpts ])
+    wpts = [ wpts[i] for i in kept ]
 
     # parsed original latitudes, longitudes and altitudes
     latitudes = [ wpt.lat for wpt in wpts ]
@@ -42,7 +43,7 @@ def main(track_fpath, window, grade):
 
     # accumulated distance on each waypoint
     dists = [ elefix.wpt_distance(wpair[0], wpair[1]) for wpair in zip(wpts[:-1], wpts[1:]) ]
-    dists_acc = [ sum(dists[:i]) for i in range(len(wpts)) ]
+    dists_acc = [0.0] + list(accumulate(dists))
     totaldist = dists_acc[-1]
 
     # original accumulated elevation gain
@@ -65,33 +66,69 @@ def main(track_fpath, window, grade):
     print("Avg elevation diff (SRTM + smoothing): {:.2f}".format(diff_srtm))
     print("Avg elevation diff (raw SRTM): {:.2f}".format(diff_srtm_raw))
     
-    # draw diagram
-    wpts = []
-    for w in zip(dists_acc, altitudes_orig, altitudes_srtm_raw, altitudes_srtm):
-        wpts.append({'dist':w[0], 'type':'Original', 'alt':w[1]})
-        wpts.append({'dist':w[0], 'type':'SRTM', 'alt':w[2]})
-        wpts.append({'dist':w[0], 'type':'SRTM + Savitzky-Golay', 'alt':w[3]})
-    fig = px.line(wpts, x='dist', y='alt', color='type', template='simple_white',
-                  labels={
-                      'dist': 'Distance',
-                      'alt': 'Altitude',
-                      'type': 'Data source',
-                  })
-    fig.update_traces(patch={"line":{"color":"blue", "width":1}}, 
-                      selector={"legendgroup":"Original"})
-    fig.update_traces(patch={"line":{"color":"red", "width":1}}, 
-                      selector={"legendgroup":"SRTM"})
-    fig.update_traces(patch={"line":{"color":"green", "width":1}}, 
-                      selector={"legendgroup":"SRTM + Savitzky-Golay"})
+    # draw diagram, each series downsampled keeping its shape
+    fig = go.Figure()
+    series = [
+        ('Original', altitudes_orig, 'blue'),
+        ('SRTM', altitudes_srtm_raw, 'red'),
+        ('SRTM + Savitzky-Golay', altitudes_srtm, 'green'),
+    ]
+    for name, alts, color in series:
+        x, y = lttb(dists_acc, alts, plot_points)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=name,
+                                   line={"color":color, "width":1}))
+    fig.update_layout(template='simple_white',
+                      xaxis_title='Distance',
+                      yaxis_title='Altitude',
+                      legend_title_text='Data source')
     fig.show()
 
 
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of y(x) to n_out points"""
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    # both ends and at least one bucket
+    n_out = max(n_out, 3)
+    if n_out >= n:
+        return x, y
+
+    # first and last points are kept, the rest is split in n_out-2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i+1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i+1], edges[i+2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # keep the point forming the largest triangle with the previous
+        # selected point and the average of the next bucket
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i+1] = a
+
+    return x[selected], y[selected]
+
 if __name__ == '__main__':
     
     parser = argparse.ArgumentParser(description="Calculates elevation data based on SRTM and applies Savitzky-Golay smoothing filter")
     parser.add_argument("track_file", help='Input track file (GPX or TCX)')
     parser.add_argument("-w", "--window", required=False, default=DEF_SAVGOL_WINDOW, type=int, help='Smoothing window')
     parser.add_argument("-g", "--grade", required=False, default=DEF_SAVGOL_GRADE, type=int, choices=[2,3], help='Smoothing polynom grade')
+    parser.add_argument("-p", "--plot-points", required=False, default=DEF_PLOT_POINTS, type=int, help='Points drawn per series (at least 3)')
     args = parser.parse_args()
 
-    main(args.track_file, args.window, args.grade)
+    if args.plot_points < 3:
+        parser.error('--plot-points must be at least 3')
+
+    main(args.track_file, args.window, args.grade, args.plot_points)
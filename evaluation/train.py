@@ -33,12 +33,8 @@ def main(dataset_dir):
                 wpts = elefix.tcx_parse(track_content)
 
         # remove waypoints for which the distance to the next one is 0
-        i = 0
-        while i < len(wpts)-1:
-            if elefix.wpt_distance(wpts[i], wpts[i+1]) == 0.0:
-                del wpts[i]
-            else:
-                i += 1
+        kept, _ = elefix.track_preprocess([ wpt.lat for wpt in wpts ], [ wpt.lon for wpt in wpts ])
+        wpts = [ wpts[i] for i in kept ]
 
         # original latitudes, longitudes and altitudes
         latitudes = [ wpt.lat for wpt in wpts ]
@@ -14,10 +14,15 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[],
     packages=setuptools.find_packages(),
     scripts=[
         'bin/srtm_asc_to_bin.py'
     ],
+    entry_points={
+        'console_scripts': [
+            'elefix=elefix.__main__:main',
+        ],
+    },
 )